@@ -1,10 +1,17 @@
 import abc
+import os
 
 from dateutil.parser import parse
 from edx_rest_framework_extensions.auth.jwt.decoder import configured_jwt_decode_handler
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
 
 from course_discovery.apps.course_metadata.models import Image, Video
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # pylint: disable=invalid-name
+
 
 class AbstractDataLoader(metaclass=abc.ABCMeta):
     """ Base class for all data loaders.
@@ -23,30 +30,70 @@ class AbstractDataLoader(metaclass=abc.ABCMeta):
         Arguments:
             partner (Partner): Partner which owns the APIs and data being loaded
             api_url (str): URL of the API from which data is loaded
-            max_workers (int): Number of worker threads to use when traversing paginated responses.
+            max_workers (int): Number of worker threads to use when traversing paginated responses. Defaults to a
+                pool sized for network-bound work, as the threads mostly wait on API responses. refresh_course_metadata
+                always passes an explicit value, so the default only applies to loaders constructed elsewhere.
             is_threadsafe (bool): True if multiple threads can be used to write data.
             enable_api (bool): True if we want to use the api functionalities and clients with the dataloader.
                 This will most likely only be turned off for event bus use cases.
         """
         self.partner = partner
         self.enable_api = enable_api
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 5)
+        self.is_threadsafe = is_threadsafe
+
         if self.enable_api:
             self.api_url = api_url.strip('/') if api_url else api_url
             self.api_client = self.partner.oauth_api_client
+            self.size_connection_pool(self.api_client)
             self.username = self.get_username_from_client(self.api_client)
 
-        self.max_workers = max_workers
-        self.is_threadsafe = is_threadsafe
-
     @abc.abstractmethod
     def ingest(self):  # pragma: no cover
         """ Load data for all supported objects (e.g. courses, runs). """
 
+    def size_connection_pool(self, client):
+        """
+        Mount an adapter on the client whose connection pool can hold a kept-alive connection for every worker thread.
+
+        The client is shared by all loaders run for the partner, so the size of the pool mounted for them is recorded
+        on the client, and an adapter that is already large enough is kept along with the connections it holds.
+        Adapters mounted by anything other than requests itself are left alone.
+        """
+        pool_size = max(self.max_workers, DEFAULT_POOLSIZE)
+        if getattr(client, 'data_loader_pool_size', DEFAULT_POOLSIZE) >= pool_size:
+            return
+
+        for prefix in ('http://', 'https://'):
+            current_adapter = client.get_adapter(prefix)
+            if type(current_adapter) is not HTTPAdapter:  # pylint: disable=unidiomatic-typecheck
+                continue
+
+            client.mount(prefix, HTTPAdapter(
+                pool_connections=DEFAULT_POOLSIZE,
+                pool_maxsize=pool_size,
+                max_retries=current_adapter.max_retries,
+            ))
+
+        client.data_loader_pool_size = pool_size
+
     def get_username_from_client(self, client):
         token = client.get_jwt_access_token()
         decoded_jwt = configured_jwt_decode_handler(token)
         return decoded_jwt.get('preferred_username')
 
+    @classmethod
+    def parse_json(cls, response):
+        """ Decodes the JSON body of an API response, using orjson's faster parser when it is installed. """
+        if orjson:
+            try:
+                return orjson.loads(response.content)
+            except orjson.JSONDecodeError:
+                # Let requests raise its own error for the body, which the loaders retry as a failed request.
+                pass
+
+        return response.json()
+
     @classmethod
     def clean_string(cls, s):
         """ Removes all leading and trailing spaces. Returns None if the resulting string is empty. """
@@ -1,7 +1,6 @@
 import datetime
 import logging
 
-import pytz
 from analyticsclient.client import Client
 
 from course_discovery.apps.course_metadata.data_loaders import AbstractDataLoader
@@ -36,7 +35,7 @@ class AnalyticsAPIDataLoader(AbstractDataLoader):
 
     def ingest(self):
         """ Load data for all course runs. """
-        now = datetime.datetime.now(pytz.UTC)
+        now = datetime.datetime.now(datetime.timezone.utc)
         # We don't need a high level of precision - looking for ~6months of data
         six_months_ago = now - datetime.timedelta(days=180)
         course_summaries_response = self.analytics_api_client().course_summaries()
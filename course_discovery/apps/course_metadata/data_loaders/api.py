@@ -1,18 +1,24 @@
 import concurrent.futures
+import contextlib
 import logging
 import math
 import threading
 import time
 from decimal import Decimal
+from functools import partial
 from io import BytesIO
+from itertools import islice
 
 import backoff
 import requests
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files import File
 from django.core.management import CommandError
+from django.db import transaction
 from django.db.models import Q
-from opaque_keys.edx.keys import CourseKey
+from django.utils.functional import cached_property
+from edx_django_utils.cache import get_cache_key
 
 from course_discovery.apps.core.models import Currency
 from course_discovery.apps.course_metadata.choices import CourseRunPacing, CourseRunStatus
@@ -23,7 +29,9 @@ from course_discovery.apps.course_metadata.models import (
     Source, Video
 )
 from course_discovery.apps.course_metadata.toggles import BYPASS_LMS_DATA_LOADER__END_DATE_UPDATED_CHECK
-from course_discovery.apps.course_metadata.utils import push_to_ecommerce_for_course_run, subtract_deadline_delta
+from course_discovery.apps.course_metadata.utils import (
+    parse_course_key, push_to_ecommerce_for_course_run, subtract_deadline_delta
+)
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +58,14 @@ class CoursesApiDataLoader(AbstractDataLoader):
         super().__init__(partner, api_url, max_workers, is_threadsafe, enable_api)
         self.default_product_source = Source.objects.get(slug=settings.DEFAULT_PRODUCT_SOURCE_SLUG)
 
+    @cached_property
+    def empty_course_type(self):
+        return CourseType.objects.get(slug=CourseType.EMPTY)
+
+    @cached_property
+    def empty_course_run_type(self):
+        return CourseRunType.objects.get(slug=CourseRunType.EMPTY)
+
     def ingest(self):
         logger.info('Refreshing Courses and CourseRuns from %s...', self.partner.courses_api_url)
 
@@ -62,8 +78,10 @@ class CoursesApiDataLoader(AbstractDataLoader):
         pagerange = range(initial_page + 1, pages + 1)
         logger.info('Looping to request all %d pages...', pages)
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:  # pragma: no cover
-            if self.is_threadsafe:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            if self.is_threadsafe:  # pragma: no cover
+                # Bound the number of queued page loads so submissions do not pile up ahead of the workers.
+                slots = threading.BoundedSemaphore(self.max_pages_in_flight)
                 for page in pagerange:
                     # This time.sleep is to make it very likely that this method does not encounter a 429 status
                     # code by increasing the amount of time between each code. More details at LEARNER-5560
@@ -71,14 +89,34 @@ class CoursesApiDataLoader(AbstractDataLoader):
                     # will take ~30 minutes.
                     # TODO Ticket to gracefully handle 429 https://openedx.atlassian.net/browse/LEARNER-5565
                     time.sleep(30)
-                    executor.submit(self._load_data, page)
+                    slots.acquire()  # pylint: disable=consider-using-with
+                    executor.submit(self._load_data, page).add_done_callback(lambda future: slots.release())
             else:
-                for future in [executor.submit(self._make_request, page) for page in pagerange]:
-                    response = future.result()
-                    self._process_response(response)
+                self._process_pages(executor, pagerange)
 
         logger.info('Retrieved %d course runs from %s.', count, self.partner.courses_api_url)
 
+    @property
+    def max_pages_in_flight(self):
+        """ Number of page requests allowed to be outstanding at any time while ingesting. """
+        return self.max_workers * 2
+
+    def _process_pages(self, executor, pagerange):
+        """
+        Request the given pages through a sliding window of futures, processing each response as soon as it arrives.
+
+        Only a bounded number of requests are outstanding at once, so a slow page does not hold up pages that have
+        already been downloaded, and responses do not accumulate in memory while waiting to be processed.
+        """
+        pages = iter(pagerange)
+        futures = {executor.submit(self._make_request, page) for page in islice(pages, self.max_pages_in_flight)}
+
+        while futures:
+            done, futures = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                self._process_response(future.result())
+                futures.update(executor.submit(self._make_request, page) for page in islice(pages, 1))
+
     def _load_data(self, page):  # pragma: no cover
         """Make a request for the given page and process the response."""
         response = self._make_request(page)
@@ -101,38 +139,52 @@ class CoursesApiDataLoader(AbstractDataLoader):
         params = {'page': page, 'page_size': self.PAGE_SIZE, 'username': self.username, 'active_only': True}
         response = self.api_client.get(self.api_url + '/courses/', params=params)
         response.raise_for_status()
-        return response.json()
+        return self.parse_json(response)
 
     def _process_response(self, response):
         results = response['results']
         logger.info('Retrieved %d course runs...', len(results))
 
-        for body in results:
-            self.process_single_course_run(body)
+        # Commit the writes for the whole page at once, rather than after every statement. Pages processed by
+        # concurrent threads are left in autocommit instead: runs of a course are often spread across pages, and
+        # threads holding the locks of a whole page each would wait on, and deadlock with, one another.
+        page_transaction = contextlib.nullcontext() if self.is_threadsafe else transaction.atomic()
+        with page_transaction:
+            failures = sum(not self.process_single_course_run(body) for body in results)
+
+        logger.info('Processed %d course runs, %d of which failed.', len(results), failures)
 
     def process_single_course_run(self, body):
+        """
+        Creates or updates the course run, and its course, described by the body.
+
+        Returns:
+            bool: True if the course run was processed without errors.
+        """
         course_run_id = body['id']
 
-        logger.info(f"Starting course processing for id {course_run_id}")
+        logger.debug(f"Starting course processing for id {course_run_id}")
         try:
-            body = self.clean_strings(body)
-            official_run, draft_run = self.get_course_run(body)
-            if official_run or draft_run:
-                self.update_course_run(official_run, draft_run, body)
-                if not self.partner.uses_publisher:
-                    # Without publisher, we'll use Studio as the source of truth for course data
-                    official_course = getattr(official_run, 'canonical_for_course', None)
-                    draft_course = getattr(draft_run, 'canonical_for_course', None)
-                    if official_course or draft_course:
-                        self.update_course(official_course, draft_course, body)
-            else:
-                course, created = self.get_or_create_course(body)
-                course_run = self.create_course_run(course, body)
-                if created:
-                    logger.info(f"Course created with uuid {course.uuid} and key {course.key}")
-                    logger.info(f"Course run created with uuid {course_run.uuid} and key {course_run.key}")
-                    course.canonical_course_run = course_run
-                    course.save()
+            # A savepoint per run, so a failed run is rolled back without aborting the rest of the page.
+            with transaction.atomic():
+                body = self.clean_strings(body)
+                official_run, draft_run = self.get_course_run(body)
+                if official_run or draft_run:
+                    self.update_course_run(official_run, draft_run, body)
+                    if not self.partner.uses_publisher:
+                        # Without publisher, we'll use Studio as the source of truth for course data
+                        official_course = getattr(official_run, 'canonical_for_course', None)
+                        draft_course = getattr(draft_run, 'canonical_for_course', None)
+                        if official_course or draft_course:
+                            self.update_course(official_course, draft_course, body)
+                else:
+                    course, created = self.get_or_create_course(body)
+                    course_run = self.create_course_run(course, body)
+                    if created:
+                        logger.info(f"Course created with uuid {course.uuid} and key {course.key}")
+                        logger.info(f"Course run created with uuid {course_run.uuid} and key {course_run.key}")
+                        course.canonical_course_run = course_run
+                        course.save()
         except Exception:  # pylint: disable=broad-except
             if self.enable_api:
                 msg = 'An error occurred while updating {course_run} from {api_url}'.format(
@@ -145,6 +197,9 @@ class CoursesApiDataLoader(AbstractDataLoader):
                 )
 
             logger.exception(msg)
+            return False
+
+        return True
 
     def get_course_run(self, body):
         """
@@ -172,9 +227,21 @@ class CoursesApiDataLoader(AbstractDataLoader):
             self._update_verified_deadline_for_course_run(draft_run)
             has_upgrade_deadline_override = run.seats.filter(upgrade_deadline_override__isnull=False)
             if not has_upgrade_deadline_override and official_run:
-                push_to_ecommerce_for_course_run(official_run)
+                # Ecommerce only hears about the new deadlines once they are committed, and no database locks are held
+                # while waiting on it.
+                transaction.on_commit(partial(self._push_deadlines_to_ecommerce, official_run))
+
+        logger.debug(f'Processed course run with UUID [{run.uuid}] and key [{run.key}].')
 
-        logger.info(f'Processed course run with UUID [{run.uuid}] and key [{run.key}].')
+    def _push_deadlines_to_ecommerce(self, course_run):
+        """
+        Push the seat deadlines of a committed course run to ecommerce. This runs once the page's transaction has
+        committed, so a failure is logged here rather than aborting the runs and pages that follow.
+        """
+        try:
+            push_to_ecommerce_for_course_run(course_run)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('An error occurred while pushing the deadlines of %s to ecommerce', course_run.key)
 
     def create_course_run(self, course, body):
         defaults = self.format_course_run_data(body, course=course)
@@ -185,7 +252,7 @@ class CoursesApiDataLoader(AbstractDataLoader):
         if latest_run and latest_run.type:
             defaults['type'] = latest_run.type
         else:
-            defaults['type'] = CourseRunType.objects.get(slug=CourseRunType.EMPTY)
+            defaults['type'] = self.empty_course_run_type
 
         # Course will always be an official version. But if it _does_ have a draft version, the run should too.
         if course.draft_version:
@@ -197,14 +264,14 @@ class CoursesApiDataLoader(AbstractDataLoader):
             return CourseRun.objects.create(**defaults)
 
     def get_or_create_course(self, body):
-        course_run_key = CourseKey.from_string(body['id'])
+        course_run_key = parse_course_key(body['id'])
         course_key = self.get_course_key_from_course_run_key(course_run_key)
         defaults = self.format_course_data(body)
         # We need to add the key to the defaults because django ignores kwargs with __
         # separators when constructing the create request
         defaults['key'] = course_key
         defaults['partner'] = self.partner
-        defaults['type'] = CourseType.objects.get(slug=CourseType.EMPTY)
+        defaults['type'] = self.empty_course_type
 
         draft_version = Course.everything.filter(key__iexact=course_key, partner=self.partner, draft=True).first()
         defaults['draft_version'] = draft_version
@@ -232,7 +299,7 @@ class CoursesApiDataLoader(AbstractDataLoader):
         self._update_instance(draft_course, validated_data)
 
         course = official_course or draft_course
-        logger.info('Processed course with key [%s].', course.key)
+        logger.debug('Processed course with key [%s].', course.key)
 
     def _update_verified_deadline_for_course_run(self, course_run):
         seats = course_run.seats.filter(type=Seat.VERIFIED) if course_run and course_run.end else []
@@ -334,6 +401,8 @@ class EcommerceApiDataLoader(AbstractDataLoader):
         self.course_run_count = 0
         self.entitlement_count = 0
         self.enrollment_code_count = 0
+        self.currencies = {}
+        self.seat_types = {}
 
         # Thread locks to protect access to the counts
         self.course_run_count_lock = threading.Lock()
@@ -353,6 +422,10 @@ class EcommerceApiDataLoader(AbstractDataLoader):
         self._delete_entitlements()
 
     def _load_ecommerce_data(self):
+        # Look up currencies and seat types once per run, rather than once per product.
+        self.currencies = {currency.code: currency for currency in Currency.objects.all()}
+        self.seat_types = {seat_type.slug: seat_type for seat_type in SeatType.objects.all()}
+
         course_runs = self._request_course_runs(self.initial_page)
         entitlements = self._request_entitlements(self.initial_page)
         enrollment_codes = self._request_enrollment_codes(self.initial_page)
@@ -453,7 +526,7 @@ class EcommerceApiDataLoader(AbstractDataLoader):
     )
     def _request_course_runs(self, page):
         params = {'page': page, 'page_size': self.PAGE_SIZE, 'include_products': True}
-        return self.api_client.get(self.api_url + '/courses/', params=params).json()
+        return self.parse_json(self.api_client.get(self.api_url + '/courses/', params=params))
 
     @backoff.on_exception(
         backoff.expo,
@@ -462,7 +535,7 @@ class EcommerceApiDataLoader(AbstractDataLoader):
     )
     def _request_entitlements(self, page):
         params = {'page': page, 'page_size': self.PAGE_SIZE, 'product_class': 'Course Entitlement'}
-        return self.api_client.get(self.api_url + '/products/', params=params).json()
+        return self.parse_json(self.api_client.get(self.api_url + '/products/', params=params))
 
     @backoff.on_exception(
         backoff.expo,
@@ -471,7 +544,7 @@ class EcommerceApiDataLoader(AbstractDataLoader):
     )
     def _request_enrollment_codes(self, page):
         params = {'page': page, 'page_size': self.PAGE_SIZE, 'product_class': 'Enrollment Code'}
-        return self.api_client.get(self.api_url + '/products/', params=params).json()
+        return self.parse_json(self.api_client.get(self.api_url + '/products/', params=params))
 
     def _process_course_runs(self, response):
         results = response['results']
@@ -525,6 +598,18 @@ class EcommerceApiDataLoader(AbstractDataLoader):
             logger.info(msg)
         entitlements_to_delete.delete()
 
+    def get_currency(self, code):
+        """ Returns the Currency with the given code, querying the database only if it has not been seen yet. """
+        if code not in self.currencies:
+            self.currencies[code] = Currency.objects.get(code=code)
+        return self.currencies[code]
+
+    def get_seat_type(self, slug):
+        """ Returns the SeatType with the given slug, querying the database only if it has not been seen yet. """
+        if slug not in self.seat_types:
+            self.seat_types[slug] = SeatType.objects.get(slug=slug)
+        return self.seat_types[slug]
+
     def _check_future_and_process(self, future, process_fn):
         check_exception = future.exception()
         if check_exception is None:
@@ -578,7 +663,7 @@ class EcommerceApiDataLoader(AbstractDataLoader):
             return
 
         try:
-            currency = Currency.objects.get(code=currency_code)
+            currency = self.get_currency(currency_code)
         except Currency.DoesNotExist:
             logger.warning("Could not find currency [%s]", currency_code)
             return
@@ -587,7 +672,7 @@ class EcommerceApiDataLoader(AbstractDataLoader):
 
         certificate_type = attributes.get('certificate_type', Seat.AUDIT)
         try:
-            seat_type = SeatType.objects.get(slug=certificate_type)
+            seat_type = self.get_seat_type(certificate_type)
         except SeatType.DoesNotExist:
             msg = ('Could not find seat type {seat_type} while loading seat with sku {sku} for course run with key '
                    '{key}'.format(seat_type=certificate_type, sku=sku, key=course_run.key))
@@ -688,7 +773,7 @@ class EcommerceApiDataLoader(AbstractDataLoader):
             return None
 
         try:
-            Currency.objects.get(code=currency_code)
+            self.get_currency(currency_code)
         except Currency.DoesNotExist:
             msg = 'Could not find currency {code} while loading {product} {title} with sku {sku}'.format(
                 product=product_class['value'], code=currency_code, title=title, sku=sku
@@ -729,7 +814,7 @@ class EcommerceApiDataLoader(AbstractDataLoader):
             return None
 
         try:
-            currency = Currency.objects.get(code=currency_code)
+            currency = self.get_currency(currency_code)
         except Currency.DoesNotExist:
             msg = 'Could not find currency {code} while loading entitlement {title} with sku {sku}'.format(
                 code=currency_code, title=title, sku=sku
@@ -739,7 +824,7 @@ class EcommerceApiDataLoader(AbstractDataLoader):
 
         mode_name = attributes.get('certificate_type')
         try:
-            mode = SeatType.objects.get(slug=mode_name)
+            mode = self.get_seat_type(mode_name)
         except SeatType.DoesNotExist:
             msg = 'Could not find mode {mode} while loading entitlement {title} with sku {sku}'.format(
                 mode=mode_name, title=title, sku=sku
@@ -765,7 +850,7 @@ class EcommerceApiDataLoader(AbstractDataLoader):
         msg = 'Creating entitlement {title} with sku {sku} for partner {partner}'.format(
             title=title, sku=sku, partner=self.partner
         )
-        logger.info(msg)
+        logger.debug(msg)
         entitlement, _ = course.entitlements.update_or_create(mode=mode, defaults=defaults)
         if course.draft_version:
             draft_entitlement, _ = course.draft_version.entitlements.update_or_create(
@@ -818,7 +903,7 @@ class EcommerceApiDataLoader(AbstractDataLoader):
         msg = 'Creating enrollment code {title} with sku {sku} for partner {partner}'.format(
             title=title, sku=sku, partner=self.partner
         )
-        logger.info(msg)
+        logger.debug(msg)
 
         seat, _ = course_run.seats.update_or_create(type=seat_type, defaults=defaults)
         if course_run.draft_version:
@@ -842,6 +927,7 @@ class ProgramsApiDataLoader(AbstractDataLoader):
     image_width = 1440
     image_height = 480
     XSERIES = None
+    BANNER_IMAGE_VALIDATORS_TIMEOUT = 60 * 60 * 24 * 7
 
     def __init__(self, partner, api_url, max_workers=None, is_threadsafe=False):
         super().__init__(partner, api_url, max_workers, is_threadsafe)
@@ -854,30 +940,48 @@ class ProgramsApiDataLoader(AbstractDataLoader):
 
         logger.info('Refreshing programs from %s...', api_url)
 
-        while page:
-            params = {'page': page, 'page_size': self.PAGE_SIZE}
-            response = self.api_client.get(self.api_url + '/programs/', params=params)
-            response.raise_for_status()
-            response_json = response.json()
-            count = response_json['count']
-            results = response_json['results']
-            logger.info('Retrieved %d programs...', len(results))
-
-            if response_json['next']:
-                page += 1
-            else:
-                page = None
-
-            for program in results:
-                program = self.clean_strings(program)
-                self.update_program(program)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(self._request_programs, page)
+            while future:
+                response_json = future.result()
+                count = response_json['count']
+                results = response_json['results']
+                logger.info('Retrieved %d programs...', len(results))
+
+                # Fetch the next page while the programs on this one are being written.
+                if response_json['next']:
+                    page += 1
+                    future = executor.submit(self._request_programs, page)
+                else:
+                    future = None
+
+                programs = [self.clean_strings(program) for program in results]
+                organizations = self._get_organizations(programs)
+                for program in programs:
+                    self.update_program(program, organizations)
 
         logger.info('Retrieved %d programs from %s.', count, api_url)
 
+    def _request_programs(self, page):
+        params = {'page': page, 'page_size': self.PAGE_SIZE}
+        response = self.api_client.get(self.api_url + '/programs/', params=params)
+        response.raise_for_status()
+        return self.parse_json(response)
+
     def _get_uuid(self, body):
         return body['uuid']
 
-    def update_program(self, body):
+    def _get_organizations(self, programs):
+        """ Returns the partner's organizations referenced by a page of programs, keyed by organization key. """
+        # Malformed entries are left for update_program to report against the program they belong to.
+        org_keys = {
+            org.get('key') for program in programs for org in program.get('organizations') or []
+            if isinstance(org, dict)
+        }
+        organizations = Organization.objects.filter(key__in=org_keys, partner=self.partner)
+        return {organization.key: organization for organization in organizations}
+
+    def update_program(self, body, organizations):
         uuid = self._get_uuid(body)
 
         try:
@@ -895,7 +999,7 @@ class ProgramsApiDataLoader(AbstractDataLoader):
                 partner=self.partner,
                 defaults=defaults
             )
-            self._update_program_organizations(body, program)
+            self._update_program_organizations(body, program, organizations)
             self._update_program_courses_and_runs(body, program)
             self._update_program_banner_image(body, program)
             program.save()
@@ -910,25 +1014,22 @@ class ProgramsApiDataLoader(AbstractDataLoader):
         # The course_code key field is technically useless, so we must build the course list from the
         # associated course runs.
         courses = Course.objects.filter(course_runs__key__in=course_run_keys).distinct()
-        program.courses.clear()
-        program.courses.add(*courses)
+        program.courses.set(courses)
 
         # Do a diff of all the course runs and the explicitly-associated course runs to determine
-        # which course runs should be explicitly excluded.
+        # which course runs should be explicitly excluded. set() only writes the rows that changed since the last load.
         excluded_course_runs = CourseRun.objects.filter(course__in=courses).exclude(key__in=course_run_keys)
-        program.excluded_course_runs.clear()
-        program.excluded_course_runs.add(*excluded_course_runs)
+        program.excluded_course_runs.set(excluded_course_runs)
 
-    def _update_program_organizations(self, body, program):
+    def _update_program_organizations(self, body, program, page_organizations):
         uuid = self._get_uuid(body)
         org_keys = [org['key'] for org in body['organizations']]
-        organizations = Organization.objects.filter(key__in=org_keys, partner=self.partner)
+        organizations = [page_organizations[key] for key in dict.fromkeys(org_keys) if key in page_organizations]
 
-        if len(org_keys) != organizations.count():
+        if len(org_keys) != len(organizations):
             logger.error('Organizations for program [%s] are invalid!', uuid)
 
-        program.authoring_organizations.clear()
-        program.authoring_organizations.add(*organizations)
+        program.authoring_organizations.set(organizations)
 
     def _get_banner_image_url(self, body):
         image_key = f'w{self.image_width}h{self.image_height}'
@@ -941,13 +1042,32 @@ class ProgramsApiDataLoader(AbstractDataLoader):
             logger.warning('There are no banner image url for program %s', program.title)
             return
 
-        r = requests.get(image_url)  # pylint: disable=missing-timeout
-        if r.status_code == 200:
+        # Remember the validators the image was served with, so that unchanged banners are neither downloaded
+        # nor re-rendered into their variations on the next ingest.
+        validators_cache_key = get_cache_key(
+            resource='program_banner_image_validators', program=program.uuid, image_url=image_url
+        )
+        headers = {}
+        validators = cache.get(validators_cache_key) if program.banner_image else None
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        r = requests.get(image_url, headers=headers)  # pylint: disable=missing-timeout
+        if r.status_code == 304:
+            logger.debug('The banner image %s for program %s has not changed', image_url, program.title)
+        elif r.status_code == 200:
             banner_downloaded = File(BytesIO(r.content))
             program.banner_image.save(
                 'banner.jpg',
                 banner_downloaded
             )
             program.save()
+
+            validators = {'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified')}
+            if any(validators.values()):
+                cache.set(validators_cache_key, validators, timeout=self.BANNER_IMAGE_VALIDATORS_TIMEOUT)
         else:
             logger.exception('Loading the banner image %s for program %s failed', image_url, program.title)
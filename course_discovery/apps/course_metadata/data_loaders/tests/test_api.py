@@ -1,11 +1,14 @@
+import copy
 import datetime
 import json
+import math
 from decimal import Decimal
 from unittest import mock
 
 import ddt
 import pytest
 import pytz
+import requests
 import responses
 from django.conf import settings
 from django.core.management import CommandError
@@ -14,6 +17,7 @@ from django.test import TestCase
 from edx_django_utils.cache import TieredCache
 from edx_toggles.toggles.testutils import override_waffle_switch
 from pytz import UTC
+from requests.adapters import HTTPAdapter
 from slumber.exceptions import HttpClientError
 
 from course_discovery.apps.core.tests.utils import mock_api_callback, mock_jpeg_callback
@@ -52,6 +56,26 @@ class AbstractDataLoaderTest(TestCase):
         for s in ('\tabc', 'abc', ' abc ', 'abc ', '\tabc\t '):
             assert AbstractDataLoader.clean_string(s) == 'abc'
 
+    def test_parse_json(self):
+        """ Verify the method decodes response bodies with and without orjson installed. """
+        response = mock.Mock(content=b'{"results": [1, 2]}')
+        response.json.return_value = {'results': [1, 2]}
+
+        assert AbstractDataLoader.parse_json(response) == {'results': [1, 2]}
+        response.json.assert_not_called()
+
+        with mock.patch('course_discovery.apps.course_metadata.data_loaders.orjson', None):
+            assert AbstractDataLoader.parse_json(response) == {'results': [1, 2]}
+        response.json.assert_called_once_with()
+
+    def test_parse_json_invalid_body(self):
+        """ Verify a body that is not JSON raises the error requests raises for it, which the loaders retry on. """
+        response = requests.Response()
+        response._content = b'<html>502 Bad Gateway</html>'  # pylint: disable=protected-access
+
+        with pytest.raises(requests.exceptions.RequestException):
+            AbstractDataLoader.parse_json(response)
+
     def test_parse_date(self):
         """ Verify the method properly parses dates. """
         # Do nothing for empty values
@@ -99,6 +123,55 @@ class CoursesApiDataLoaderTests(DataLoaderTestMixin, TestCase):
         assert not _fatal_code(HttpClientError(response=response_with_429))
         assert not _fatal_code(HttpClientError(response=response_with_504))
 
+    def test_connection_pool_sized_for_workers(self):
+        """ Verify the API client can keep a connection alive for every worker thread. """
+        with mock.patch(
+            'course_discovery.apps.course_metadata.data_loaders.configured_jwt_decode_handler',
+            return_value={'preferred_username': 'test_username'},
+        ):
+            loader = self.loader_class(self.partner, self.api_url, max_workers=40)
+            adapter = loader.api_client.get_adapter(self.api_url)
+            assert loader.api_client.data_loader_pool_size == 40
+            assert adapter.poolmanager.connection_pool_kw['maxsize'] == 40
+
+            # A loader with fewer workers keeps the larger pool in place.
+            self.loader_class(self.partner, self.api_url, max_workers=2)
+            assert loader.api_client.get_adapter(self.api_url) is adapter
+
+    def test_connection_pool_keeps_custom_adapters(self):
+        """ Verify sizing the pool keeps the retry policy of the mounted adapter, and leaves custom adapters alone. """
+        class CustomAdapter(HTTPAdapter):
+            pass
+
+        client = self.partner.oauth_api_client
+        custom_adapter = CustomAdapter()
+        client.mount('http://', custom_adapter)
+        client.mount('https://', HTTPAdapter(max_retries=3))
+
+        with mock.patch(
+            'course_discovery.apps.course_metadata.data_loaders.configured_jwt_decode_handler',
+            return_value={'preferred_username': 'test_username'},
+        ):
+            self.loader_class(self.partner, self.api_url, max_workers=40)
+
+        assert client.get_adapter('http://') is custom_adapter
+        assert client.get_adapter('https://').max_retries.total == 3
+        assert client.get_adapter('https://').poolmanager.connection_pool_kw['maxsize'] == 40
+
+    @ddt.data((1, 5), (4, 20), (16, 32), (None, 5))
+    @ddt.unpack
+    def test_default_max_workers(self, cpu_count, expected_max_workers):
+        """ Verify the default worker count is sized for network-bound work and capped. """
+        with mock.patch('os.cpu_count', return_value=cpu_count):
+            with mock.patch(
+                'course_discovery.apps.course_metadata.data_loaders.configured_jwt_decode_handler',
+                return_value={'preferred_username': 'test_username'},
+            ):
+                loader = self.loader_class(self.partner, self.api_url)
+
+        assert loader.max_workers == expected_max_workers
+        assert loader.max_pages_in_flight == expected_max_workers * 2
+
     def assert_course_run_loaded(self, body, partner_uses_publisher=True, draft=False, new_pub=False):
         """ Assert a CourseRun corresponding to the specified data body was properly loaded into the database. """
 
@@ -236,7 +309,7 @@ class CoursesApiDataLoaderTests(DataLoaderTestMixin, TestCase):
         assert CourseRun.objects.count() == expected_num_course_runs
 
         # Verify multiple calls to ingest data do NOT result in data integrity errors.
-        with mock.patch(LOGGER_PATH) as mock_logger:
+        with mock.patch(LOGGER_PATH) as mock_logger, self.captureOnCommitCallbacks(execute=True):
             self.loader.ingest()
 
         calls = [
@@ -338,7 +411,7 @@ class CoursesApiDataLoaderTests(DataLoaderTestMixin, TestCase):
         assert CourseRun.objects.count() == expected_num_course_runs
 
         with override_waffle_switch(BYPASS_LMS_DATA_LOADER__END_DATE_UPDATED_CHECK, active=True):
-            with mock.patch(LOGGER_PATH) as mock_logger:
+            with mock.patch(LOGGER_PATH) as mock_logger, self.captureOnCommitCallbacks(execute=True):
                 self.loader.ingest()
 
         calls = [
@@ -359,6 +432,22 @@ class CoursesApiDataLoaderTests(DataLoaderTestMixin, TestCase):
         assert original_run1_deadline == updated_run1_upgrade_deadline
         assert run3.seats.first().upgrade_deadline is None
 
+    @responses.activate
+    def test_ingest_multiple_pages(self):
+        """ Verify every page is requested and processed when the results span several pages. """
+        api_data = self.mock_api()
+
+        with mock.patch.object(self.loader, 'PAGE_SIZE', 1):
+            with mock.patch.object(self.loader, '_process_response', wraps=self.loader._process_response) as process:
+                self.loader.ingest()
+
+        assert process.call_count == len(api_data)
+        requested_pages = sorted(
+            int(call.request.params['page']) for call in responses.calls if 'courses/' in call.request.url
+        )
+        assert requested_pages == list(range(1, len(api_data) + 1))
+        assert CourseRun.objects.count() == len(api_data)
+
     @responses.activate
     def test_ingest_exception_handling(self):
         """ Verify the data loader properly handles exceptions during processing of the data from the API. """
@@ -373,6 +462,88 @@ class CoursesApiDataLoaderTests(DataLoaderTestMixin, TestCase):
                     self.partner.courses_api_url
                 )
                 mock_logger.exception.assert_called_with(msg)
+                mock_logger.info.assert_any_call(
+                    'Processed %d course runs, %d of which failed.', len(api_data), len(api_data)
+                )
+
+    @responses.activate
+    def test_ingest_rolls_back_failed_course_run(self):
+        """ Verify a course run that fails part way through is rolled back, without affecting the rest of the page. """
+        api_data = self.mock_api()
+        failing_key = api_data[0]['id']
+        create_course_run = self.loader.create_course_run
+
+        def fail_for_first_run(course, body):
+            if body['id'] == failing_key:
+                raise Exception
+            return create_course_run(course, body)
+
+        with mock.patch.object(self.loader, 'create_course_run', side_effect=fail_for_first_run):
+            with mock.patch(LOGGER_PATH):
+                self.loader.ingest()
+
+        # The course created for the failed run does not outlive it.
+        assert not Course.everything.filter(key=f"{api_data[0]['org']}+{api_data[0]['number']}").exists()
+        assert not CourseRun.everything.filter(key=failing_key).exists()
+        assert CourseRun.objects.count() == len(api_data) - 1
+
+    @responses.activate
+    @mock.patch('course_discovery.apps.course_metadata.data_loaders.api.push_to_ecommerce_for_course_run')
+    def test_ingest_pushes_deadlines_after_commit(self, mock_push_to_ecomm):
+        """ Verify ecommerce is not sent the deadlines of a course run whose changes are rolled back. """
+        api_data = self.mock_api()
+        self.loader.ingest()
+
+        failing_key = api_data[0]['id']
+        update_course_run = self.loader.update_course_run
+
+        def fail_after_first_run(official_run, draft_run, body):
+            update_course_run(official_run, draft_run, body)
+            if body['id'] == failing_key:
+                raise Exception
+
+        with override_waffle_switch(BYPASS_LMS_DATA_LOADER__END_DATE_UPDATED_CHECK, active=True):
+            with mock.patch.object(self.loader, 'update_course_run', side_effect=fail_after_first_run):
+                with mock.patch(LOGGER_PATH), self.captureOnCommitCallbacks(execute=True):
+                    self.loader.ingest()
+
+        pushed_keys = {call.args[0].key for call in mock_push_to_ecomm.call_args_list}
+        assert pushed_keys
+        assert failing_key not in pushed_keys
+
+    @responses.activate
+    @mock.patch(
+        'course_discovery.apps.course_metadata.data_loaders.api.push_to_ecommerce_for_course_run',
+        side_effect=requests.exceptions.HTTPError,
+    )
+    def test_ingest_continues_after_failed_push(self, mock_push_to_ecomm):
+        """ Verify a failed push to ecommerce is logged, and does not stop the deadlines of other runs being pushed. """
+        self.mock_api()
+        self.loader.ingest()
+
+        with override_waffle_switch(BYPASS_LMS_DATA_LOADER__END_DATE_UPDATED_CHECK, active=True):
+            with mock.patch(LOGGER_PATH) as mock_logger, self.captureOnCommitCallbacks(execute=True):
+                self.loader.ingest()
+
+        pushed_keys = [call.args[0].key for call in mock_push_to_ecomm.call_args_list]
+        assert sorted(pushed_keys) == sorted(CourseRun.objects.values_list('key', flat=True))
+        mock_logger.exception.assert_has_calls([
+            mock.call('An error occurred while pushing the deadlines of %s to ecommerce', key) for key in pushed_keys
+        ])
+
+    def test_ingest_threadsafe_keeps_autocommit(self):
+        """ Verify pages processed by concurrent threads are not wrapped in a transaction of their own. """
+        process_response = self.loader._process_response  # pylint: disable=protected-access
+
+        self.loader.is_threadsafe = True
+        with mock.patch('course_discovery.apps.course_metadata.data_loaders.api.transaction') as mock_transaction:
+            process_response({'results': []})
+        mock_transaction.atomic.assert_not_called()
+
+        self.loader.is_threadsafe = False
+        with mock.patch('course_discovery.apps.course_metadata.data_loaders.api.transaction') as mock_transaction:
+            process_response({'results': []})
+        mock_transaction.atomic.assert_called_once_with()
 
     @responses.activate
     @ddt.data(True, False)
@@ -912,6 +1083,17 @@ class EcommerceApiDataLoaderTests(DataLoaderTestMixin, TestCase):
         # Verify multiple calls to ingest data do NOT result in data integrity errors.
         self.loader.ingest()
 
+    @responses.activate
+    @mock.patch('time.sleep')
+    def test_request_retries_invalid_json(self, mock_sleep):  # pylint: disable=unused-argument
+        """ Verify a page served with a body that is not JSON, such as a gateway error page, is requested again. """
+        url = self.api_url + 'courses/'
+        responses.add(responses.GET, url, body='<html>503 Service Unavailable</html>', status=503)
+        responses.add(responses.GET, url, body=json.dumps({'count': 0, 'results': []}), content_type=JSON)
+
+        assert self.loader._request_course_runs(1) == {'count': 0, 'results': []}  # pylint: disable=protected-access
+        assert len([call for call in responses.calls if call.request.url.startswith(url)]) == 2
+
     @responses.activate
     @mock.patch(LOGGER_PATH)
     def test_ingest_deletes(self, mock_logger):
@@ -1026,6 +1208,18 @@ class EcommerceApiDataLoaderTests(DataLoaderTestMixin, TestCase):
             msg = self.compose_warning_log(alt_course, alt_currency, alt_mode, product_class)
             mock_logger.warning.assert_any_call(msg)
 
+    def test_lookups_are_cached(self):
+        """ Verify currencies and seat types are only queried the first time they are looked up. """
+        seat_type = SeatTypeFactory(slug='cached-seat-type')
+
+        with self.assertNumQueries(2):
+            for __ in range(3):
+                assert self.loader.get_currency('USD').code == 'USD'
+                assert self.loader.get_seat_type(seat_type.slug) == seat_type
+
+        with pytest.raises(SeatType.DoesNotExist):
+            self.loader.get_seat_type('notamode')
+
     @ddt.unpack
     @ddt.data(
         ({"attribute_values": []}, Seat.AUDIT),
@@ -1201,6 +1395,33 @@ class ProgramsApiDataLoaderTests(DataLoaderTestMixin, TestCase):
 
         self.loader.ingest()
 
+    @responses.activate
+    def test_ingest_multiple_pages(self):
+        """ Verify every page is requested, in order, when the programs span several pages. """
+        api_data = self.mock_api()
+
+        with mock.patch.object(self.loader, 'PAGE_SIZE', 1):
+            self.loader.ingest()
+
+        requested_pages = [
+            int(call.request.params['page']) for call in responses.calls if 'programs/' in call.request.url
+        ]
+        assert requested_pages == list(range(1, len(mock_data.PROGRAMS_API_BODIES) + 1))
+        assert Program.objects.count() == len(api_data)
+
+    @responses.activate
+    def test_ingest_keeps_unchanged_excluded_course_runs(self):
+        """ Verify re-ingesting unchanged programs does not rewrite their excluded course run rows. """
+        self.mock_api()
+        self.loader.ingest()
+        through = Program.excluded_course_runs.through
+        row_ids = set(through.objects.values_list('id', flat=True))
+        assert row_ids
+
+        self.loader.ingest()
+
+        assert set(through.objects.values_list('id', flat=True)) == row_ids
+
     @responses.activate
     def test_ingest_with_missing_organizations(self):
         api_data = self.mock_api()
@@ -1217,6 +1438,58 @@ class ProgramsApiDataLoaderTests(DataLoaderTestMixin, TestCase):
         assert Program.objects.count() == len(api_data)
         assert Organization.objects.count() == 0
 
+    @responses.activate
+    def test_ingest_with_malformed_organizations(self):
+        """ Verify a malformed organization entry only fails the program it belongs to. """
+        api_data = self.mock_api()
+        bodies = copy.deepcopy(mock_data.PROGRAMS_API_BODIES)
+        bodies[0]['organizations'].append(None)
+
+        responses.reset()
+        url = self.api_url + 'programs/'
+        responses.add_callback(responses.GET, url, callback=mock_api_callback(url, bodies), content_type=JSON)
+
+        with mock.patch(LOGGER_PATH) as mock_logger:
+            self.loader.ingest()
+            mock_logger.exception.assert_any_call('Failed to load program %s', bodies[0]['uuid'])
+
+        for body in api_data[1:]:
+            self.assert_program_loaded(body)
+
+    @responses.activate
+    def test_ingest_fetches_organizations_once_per_page(self):
+        """ Verify the organizations for a page of programs are looked up with a single query. """
+        api_data = self.mock_api()
+
+        get_organizations = self.loader._get_organizations  # pylint: disable=protected-access
+
+        with self.assertNumQueries(1):
+            organizations = get_organizations(api_data)
+        assert set(organizations) == {org['key'] for body in api_data for org in body['organizations']}
+
+        with mock.patch.object(self.loader, 'PAGE_SIZE', 2), \
+                mock.patch.object(self.loader, '_get_organizations', wraps=get_organizations) as mock_get:
+            self.loader.ingest()
+
+        assert mock_get.call_count == math.ceil(len(mock_data.PROGRAMS_API_BODIES) / 2)
+
+    @responses.activate
+    def test_ingest_ignores_other_partners_organizations(self):
+        """ Verify organizations with matching keys that belong to another partner are not linked to programs. """
+        api_data = self.mock_api()
+        Organization.objects.all().delete()
+        org_keys = {org['key'] for datum in api_data for org in datum['organizations']}
+        other_partner_organizations = [OrganizationFactory(key=key) for key in org_keys]
+
+        with mock.patch(LOGGER_PATH) as mock_logger:
+            self.loader.ingest()
+            calls = [mock.call('Organizations for program [%s] are invalid!', datum['uuid']) for datum in api_data]
+            mock_logger.error.assert_has_calls(calls)
+
+        assert Program.objects.filter(partner=self.partner).count() == len(api_data)
+        for organization in other_partner_organizations:
+            assert not organization.authored_programs.exists()
+
     @responses.activate
     def test_ingest_with_existing_banner_image(self):
         TieredCache.dangerous_clear_all_tiers()
@@ -1240,3 +1513,44 @@ class ProgramsApiDataLoaderTests(DataLoaderTestMixin, TestCase):
         for program in programs:
             self.assert_program_loaded(program)
             self.assert_program_banner_image_loaded(program)
+
+    @responses.activate
+    @ddt.data(
+        ('ETag', 'If-None-Match', '"banner"'),
+        ('Last-Modified', 'If-Modified-Since', 'Wed, 21 Oct 2015 07:28:00 GMT'),
+    )
+    @ddt.unpack
+    def test_ingest_skips_unchanged_banner_image(self, validator_header, conditional_header, validator):
+        """ Verify banner images are requested conditionally, and left alone when they have not changed. """
+        TieredCache.dangerous_clear_all_tiers()
+        programs = self.mock_api()
+        conditional_requests = []
+
+        def banner_image_callback(request):
+            if request.headers.get(conditional_header) == validator:
+                conditional_requests.append(request.url)
+                return 304, {}, b''
+            status, headers, body = mock_jpeg_callback()(request)
+            return status, dict(headers, **{validator_header: validator}), body
+
+        banner_image_urls = set()
+        for program_data in programs:
+            banner_image_url = program_data.get('banner_image_urls', {}).get('w1440h480')
+            if banner_image_url:
+                banner_image_urls.add(banner_image_url)
+                responses.add_callback(
+                    responses.GET,
+                    banner_image_url,
+                    callback=banner_image_callback,
+                    content_type=JPEG
+                )
+
+        self.loader.ingest()
+        banner_images = {program.uuid: program.banner_image.name for program in Program.objects.all()}
+        assert not conditional_requests
+
+        self.loader.ingest()
+        assert set(conditional_requests) == banner_image_urls
+        assert {program.uuid: program.banner_image.name for program in Program.objects.all()} == banner_images
+        for program in programs:
+            self.assert_program_banner_image_loaded(program)
@@ -43,10 +43,11 @@ class Command(BaseCommand):
         'meta_title', 'meta_description', 'meta_keywords', 'slug', 'external_course_marketing_type'
     ]
 
-    # Mapping English and Spanish languages to IETF equivalent variants
+    # Mapping English and Spanish languages to IETF equivalent variants.
+    # Keys are lower case, product languages are normalized the same way before the lookup.
     LANGUAGE_MAP = {
-        'English': 'English - United States',
-        'Español': 'Spanish - Spain (Modern)',
+        'english': 'English - United States',
+        'español': 'Spanish - Spain (Modern)',
     }
 
     MISSING_CSV_PRODUCT_MESSAGE = "[MISSING PRODUCT IN CSV] Unable to find product details for product {} in CSV"
@@ -275,7 +276,7 @@ class Command(BaseCommand):
             ))
             minimum_effort, maximum_effort = 1, 2
 
-        language = self.LANGUAGE_MAP.get(product_dict['language'], 'English - United States')
+        language = self.LANGUAGE_MAP.get((product_dict['language'] or '').strip().lower(), 'English - United States')
 
         default_values = {  # the values that will be part of every output row in any case
             'course_enrollment_track': 'Executive Education(2U)',
@@ -135,6 +135,9 @@ class Command(BaseCommand):
                 'Command is{negation} using threads to write data.'.format(negation='' if is_threadsafe else ' not')  # lint-amnesty, pylint: disable=logging-format-interpolation
             )
 
+            # The courses and ecommerce loaders stay on a single worker: both APIs rate limit discovery's requests,
+            # and extra workers would only trade pages for 429 retries. DataLoaderConfig.max_workers only applies
+            # to the programs loader.
             pipeline = (
                 (
                     (CoursesApiDataLoader, partner.courses_api_url, 1),
@@ -6,6 +6,7 @@ import json
 from datetime import date
 from tempfile import NamedTemporaryFile
 
+import ddt
 import mock
 import responses
 from django.conf import settings
@@ -19,6 +20,7 @@ from course_discovery.apps.course_metadata.data_loaders.tests.mixins import CSVL
 LOGGER_PATH = 'course_discovery.apps.course_metadata.management.commands.populate_executive_education_data_csv'
 
 
+@ddt.ddt
 class TestPopulateExecutiveEducationDataCsv(CSVLoaderMixin, TestCase):
     """
     Test suite for populate_executive_education_data_csv management command.
@@ -327,6 +329,39 @@ class TestPopulateExecutiveEducationDataCsv(CSVLoaderMixin, TestCase):
                 '--auth_token', self.AUTH_TOKEN
             )
 
+    @responses.activate
+    @ddt.data(
+        (' español ', 'Spanish - Spain (Modern)'),
+        ('ENGLISH', 'English - United States'),
+        (None, 'English - United States'),
+    )
+    @ddt.unpack
+    def test_product_language_mapping(self, product_language, expected_language):
+        """
+        Verify the product language is mapped regardless of its case and surrounding whitespace, and that a missing
+        language falls back to English.
+        """
+        product = dict(self.SUCCESS_API_RESPONSE['products'][0], language=product_language)
+        responses.add(
+            responses.GET,
+            settings.PRODUCT_API_URL + '/?detail=2',
+            body=json.dumps({'products': [product]}),
+            status=200,
+        )
+
+        output_csv = NamedTemporaryFile()  # lint-amnesty, pylint: disable=consider-using-with
+        call_command(
+            'populate_executive_education_data_csv',
+            '--output_csv', output_csv.name,
+            '--auth_token', self.AUTH_TOKEN
+        )
+        output_csv.seek(0)
+        reader = csv.DictReader(open(output_csv.name, 'r'))  # lint-amnesty, pylint: disable=consider-using-with
+        data_row = next(reader)
+
+        assert data_row['Content Language'] == expected_language
+        assert data_row['Transcript Language'] == expected_language
+
     def _assert_api_response(self, data_row):
         """
         Assert the default API response in output CSV dict.
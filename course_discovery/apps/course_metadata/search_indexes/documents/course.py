@@ -1,10 +1,10 @@
 from django.conf import settings
 from django_elasticsearch_dsl import Index, fields
-from opaque_keys.edx.keys import CourseKey
 from taxonomy.choices import ProductTypes
 from taxonomy.utils import get_whitelisted_product_skills, get_whitelisted_serialized_skills
 
 from course_discovery.apps.course_metadata.models import Course
+from course_discovery.apps.course_metadata.utils import parse_course_key
 
 from .analyzers import case_insensitive_keyword
 from .common import BaseCourseDocument, filter_visible_runs
@@ -96,7 +96,7 @@ class CourseDocument(BaseCourseDocument):
     def prepare_org(self, obj):
         course_run = filter_visible_runs(obj.course_runs).first()
         if course_run:
-            return CourseKey.from_string(course_run.key).org
+            return parse_course_key(course_run.key).org
         return None
 
     def prepare_seat_types(self, obj):
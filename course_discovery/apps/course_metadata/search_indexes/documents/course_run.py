@@ -1,11 +1,11 @@
 from django.conf import settings
 from django_elasticsearch_dsl import Index, fields
-from opaque_keys.edx.keys import CourseKey
 from taxonomy.choices import ProductTypes
 from taxonomy.utils import get_whitelisted_product_skills, get_whitelisted_serialized_skills
 
 from course_discovery.apps.course_metadata.choices import CourseRunStatus
 from course_discovery.apps.course_metadata.models import CourseRun
+from course_discovery.apps.course_metadata.utils import parse_course_key
 
 from .analyzers import case_insensitive_keyword, html_strip
 from .common import BaseCourseDocument, filter_visible_runs
@@ -98,11 +98,11 @@ class CourseRunDocument(BaseCourseDocument):
         return self._prepare_language(obj.language)
 
     def prepare_number(self, obj):
-        course_run_key = CourseKey.from_string(obj.key)
+        course_run_key = parse_course_key(obj.key)
         return course_run_key.course
 
     def prepare_org(self, obj):
-        course_run_key = CourseKey.from_string(obj.key)
+        course_run_key = parse_course_key(obj.key)
         return course_run_key.org
 
     def prepare_paid_seat_enrollment_end(self, obj):
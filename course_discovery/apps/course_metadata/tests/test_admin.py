@@ -1,4 +1,5 @@
 import itertools
+from urllib.parse import urlparse
 
 import ddt
 import pytest
@@ -272,7 +273,7 @@ class ProgramAdminFunctionalTests(SiteMixin, LiveServerTestCase):
         # stale ContentType objects from being used.
         ContentType.objects.clear_cache()
 
-        self.site.domain = self.live_server_url.strip('http://')
+        self.site.domain = urlparse(self.live_server_url).netloc
         self.site.save()
 
         self.course_runs = factories.CourseRunFactory.create_batch(2)
@@ -13,6 +13,7 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.test import TestCase
 from edx_toggles.toggles.testutils import override_waffle_switch
+from opaque_keys import InvalidKeyError
 from slugify import slugify
 
 from course_discovery.apps.api.tests.mixins import SiteMixin
@@ -40,7 +41,7 @@ from course_discovery.apps.course_metadata.toggles import IS_SUBDIRECTORY_SLUG_F
 from course_discovery.apps.course_metadata.utils import (
     calculated_seat_upgrade_deadline, clean_html, convert_svg_to_png_from_url, create_missing_entitlement,
     download_and_save_course_image, download_and_save_program_image, ensure_draft_world, fetch_getsmarter_products,
-    is_google_drive_url, serialize_entitlement_for_ecommerce_api, serialize_seat_for_ecommerce_api,
+    is_google_drive_url, parse_course_key, serialize_entitlement_for_ecommerce_api, serialize_seat_for_ecommerce_api,
     transform_skills_data, validate_slug_format
 )
 
@@ -266,6 +267,39 @@ class MarketingSiteAPIClientTests(MarketingSiteAPIClientTestMixin):
         with pytest.raises(MarketingSiteAPIClientException):
             self.api_client.init_session  # pylint: disable=pointless-statement
 
+    @responses.activate
+    def test_init_session_reuses_login(self):
+        self.mock_login_response(200)
+        session = self.api_client.init_session
+        self.assert_responses_call_count(2)
+
+        other_client = utils.MarketingSiteAPIClient(self.username, self.password, self.api_root)
+        other_session = other_client.init_session
+        # The cached session is checked, but not logged in again.
+        self.assert_responses_call_count(3)
+        assert responses.calls[-1].request.method == 'GET'
+        assert other_session is not session
+        assert other_session.cookies.get_dict() == session.cookies.get_dict()
+
+    @responses.activate
+    def test_init_session_replaces_stale_login(self):
+        self.mock_login_response(200)
+        self.api_client.init_session  # pylint: disable=pointless-statement
+
+        # The cached session has since ended, so the admin page is refused until the client logs in again.
+        responses.reset()
+        responses.calls.reset()  # pylint: disable=no-member
+        responses.add(responses.GET, f'{self.api_root}/admin', status=403)
+        self.mock_login_response(200)
+
+        other_client = utils.MarketingSiteAPIClient(self.username, self.password, self.api_root)
+        assert other_client.init_session is not None
+        assert [call.request.method for call in responses.calls] == ['GET', 'POST', 'GET']
+
+    def test_session_cookies_cache_key_includes_password(self):
+        other_client = utils.MarketingSiteAPIClient(self.username, 'rotated-password', self.api_root)
+        assert other_client.session_cookies_cache_key != self.api_client.session_cookies_cache_key
+
     @responses.activate
     def test_csrf_token(self):
         self.mock_login_response(200)
@@ -776,6 +810,20 @@ class TestIsGoogleDriveUrl(TestCase):
         assert is_google_drive_url(url) is expected
 
 
+class TestParseCourseKey(TestCase):
+    """Test parse course key"""
+    def test_parse_course_key(self):
+        """Verify that parse_course_key parses run keys and reuses the result for repeated keys"""
+        course_key = parse_course_key('course-v1:edX+DemoX+1T2019')
+        assert (course_key.org, course_key.course, course_key.run) == ('edX', 'DemoX', '1T2019')
+        assert parse_course_key('course-v1:edX+DemoX+1T2019') is course_key
+
+    def test_parse_course_key_invalid(self):
+        """Verify that parse_course_key raises InvalidKeyError for invalid keys"""
+        with pytest.raises(InvalidKeyError):
+            parse_course_key('not a course key')
+
+
 class TestDownloadAndSaveImage(TestCase):
     """ Test to download and save image """
 
@@ -1,4 +1,5 @@
 import datetime
+import functools
 import logging
 import random
 import re
@@ -13,13 +14,16 @@ import requests
 from bs4 import BeautifulSoup
 from cairosvg import svg2png
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
 from django.db import models, transaction
 from django.utils.functional import cached_property
 from django.utils.translation import gettext as _
 from dynamic_filenames import FilePattern
+from edx_django_utils.cache import get_cache_key
 from getsmarter_api_clients.geag import GetSmarterEnterpriseApiClient
+from opaque_keys.edx.keys import CourseKey
 from slugify import slugify
 from stdimage.models import StdImageFieldFile
 
@@ -362,6 +366,17 @@ def parse_course_key_fragment(fragment):
     return split[0], split[1]
 
 
+@functools.lru_cache(maxsize=4096)
+def parse_course_key(key):
+    """
+    Parses a serialized course run key like "course-v1:edX+DemoX+1T2019" into a CourseKey.
+
+    Results are memoized, as the same keys are parsed on every data load and search index rebuild. CourseKey objects
+    are immutable, so sharing them between callers is safe. If the key is invalid, InvalidKeyError is raised.
+    """
+    return CourseKey.from_string(key)
+
+
 def validate_course_number(course_number):
     """
     Verifies that the Course Number does not contain invalid characters. Raises a ValueError if there are
@@ -574,6 +589,8 @@ class MarketingSiteAPIClient:
     username = None
     password = None
     api_url = None
+    # Drupal sessions last far longer than this, so a login can safely be shared by later clients for a while.
+    SESSION_COOKIES_TIMEOUT = 60 * 60
 
     def __init__(self, marketing_site_api_username, marketing_site_api_password, api_url):
         if not (marketing_site_api_username and marketing_site_api_password):
@@ -582,10 +599,32 @@ class MarketingSiteAPIClient:
         self.password = marketing_site_api_password
         self.api_url = api_url.strip('/')
 
+    @property
+    def session_cookies_cache_key(self):
+        # The key is hashed, and includes the password so that rotated credentials are not served an old session.
+        return get_cache_key(
+            resource='marketing_site_session_cookies',
+            api_url=self.api_url,
+            username=self.username,
+            password=self.password,
+        )
+
     @cached_property
     def init_session(self):
-        # Login to set session cookies
+        # Logging in is expensive, so reuse the cookies of a recent login to the same account when there is one.
+        cached_cookies = cache.get(self.session_cookies_cache_key)
+        if cached_cookies is not None:
+            session = requests.Session()
+            session.cookies.update(cached_cookies)
+            if self.is_logged_in(session):
+                return session
+
+            # The session ended before its cookies expired from the cache, e.g. it was logged out or purged.
+            cache.delete(self.session_cookies_cache_key)
+
         session = requests.Session()
+
+        # Login to set session cookies
         login_url = f'{self.api_url}/user'
         login_data = {
             'name': self.username,
@@ -605,8 +644,14 @@ class MarketingSiteAPIClient:
                     'url': response.url
                 }
             )
+        cache.set(self.session_cookies_cache_key, session.cookies, timeout=self.SESSION_COOKIES_TIMEOUT)
         return session
 
+    def is_logged_in(self, session):
+        """ Returns True if the session is still logged in, in which case the admin page is served to it. """
+        response = session.get(f'{self.api_url}/admin', allow_redirects=False)
+        return response.status_code == 200
+
     @property
     def api_session(self):
         self.init_session.headers.update(self.headers)